@@ -10,25 +10,32 @@ Usage:
 API will be available at: http://localhost:8000
 """
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 # Import uvicorn at runtime in the __main__ block to avoid editor/linter unresolved-import warnings
-from sentence_transformers import SentenceTransformer
-import pandas as pd
 import os
 import sys
 import asyncio
+import time
+from typing import Optional, Tuple
 from functools import lru_cache
 
 # Import functions from medical_chatbot
 sys.path.append(os.path.dirname(__file__))
 from medical_chatbot import (
-    load_dataset, 
-    load_or_build_embeddings, 
-    most_similar, 
+    encode_query,
+    search_index,
     friendly_response,
-    ensure_dataset_available
+)
+from model_registry import ModelRegistry, IndexEntry, ModelLoadError
+from semantic_cache import SemanticCache, CachedResult
+from threading_config import (
+    load_threading_config,
+    apply_threading_config,
+    create_executor,
+    executor_size,
+    warm_up,
 )
 
 # Initialize FastAPI app
@@ -48,16 +55,31 @@ app.add_middleware(
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
-# Global variables for model and data
-model = None
-emb_matrix = None
-labels = None
-df = None
-csv_path = None
+# Registry of model + index pairs, loaded on demand (see model_registry.py)
+registry: Optional[ModelRegistry] = None
+# Thread pool that /chat encodes run on (sized by threading_config)
+executor = None
+# Reuses answers for near-identical queries (see semantic_cache.py)
+semantic_cache: Optional[SemanticCache] = None
+
+# Limits shared by /chat and /ws/chat
+MAX_MESSAGE_LENGTH = 500
+WS_MAX_IN_FLIGHT = 8  # pipelined messages per WebSocket connection
+
+# Per-channel request metrics (reported in /stats)
+chat_metrics = {
+    "http": {"requests": 0, "errors": 0, "total_latency_ms": 0.0},
+    "websocket": {
+        "requests": 0, "errors": 0, "total_latency_ms": 0.0,
+        "connections": 0, "active_connections": 0,
+    },
+}
 
 # Request/Response models
 class ChatRequest(BaseModel):
     message: str
+    model: Optional[str] = None    # registry model alias, e.g. "multilingual"
+    dataset: Optional[str] = None  # registry dataset alias
 
 class ChatResponse(BaseModel):
     reply: str
@@ -72,37 +94,38 @@ class HealthResponse(BaseModel):
 # Startup event - Optimized with smart dataset management
 @app.on_event("startup")
 async def startup_event():
-    """Load model and dataset on server startup - Only downloads dataset once"""
-    global model, emb_matrix, labels, df, csv_path
+    """Load the default model and dataset on server startup - Only downloads dataset once"""
+    global registry, executor, semantic_cache
     
     print("=" * 60)
     print("🚀 Starting Sehat Medical Chatbot API v2.0")
     print("=" * 60)
     
     try:
-        # Load the sentence transformer model
-        print("📥 Loading sentence transformer model...")
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-        print("✅ Model loaded successfully!")
+        # Thread counts must be applied before the model is loaded
+        thread_config = load_threading_config()
+        apply_threading_config(thread_config)
+        executor = create_executor(thread_config)
         
-        # Smart dataset management - downloads only if not present
-        print("📊 Checking for dataset...")
-        csv_path = ensure_dataset_available()
+        registry = ModelRegistry.from_env()
         
-        if csv_path is None:
-            print("⚠️ Dataset not found and could not be downloaded!")
-            print("   Please ensure internet connection and try again.")
-            raise FileNotFoundError("Dataset not available")
+        semantic_cache = SemanticCache.from_env()
+        if semantic_cache.enabled:
+            restored = semantic_cache.load()
+            print(f"🧠 Semantic cache: {semantic_cache.max_size} entries/index, "
+                  f"radius {semantic_cache.radius} ({restored} restored)")
+        print(f"🗂️ Models: {', '.join(registry.models)} | Datasets: {', '.join(registry.datasets)}")
         
-        print(f"📊 Loading dataset from: {csv_path}")
-        # Optimized loading with dtype specification
-        df = load_dataset(csv_path)
-        print(f"✅ Dataset loaded: {len(df)} records")
+        # Preload the default pair; other models/datasets load on first request
+        print("🔄 Loading default model and embeddings (cached if available)...")
+        entry = registry.get()
+        print(f"✅ Dataset loaded: {len(entry.df)} records")
+        print(f"✅ Embeddings ready: {entry.emb_matrix.shape}")
         
-        # Build/load embeddings with caching
-        print("🔄 Loading embeddings (cached if available)...")
-        emb_matrix, labels = load_or_build_embeddings(df, model, csv_path)
-        print(f"✅ Embeddings ready: {emb_matrix.shape}")
+        # Warm-up encode on every inference thread so the first real user doesn't pay one-time costs
+        workers = executor_size(thread_config)
+        warmup_ms = warm_up(entry.model, entry.emb_matrix, executor=executor, workers=workers)
+        print(f"🔥 Warm-up done on {workers} worker threads ({warmup_ms:.1f} ms per query)")
         
         print("=" * 60)
         print("🎉 Server ready! API available at: http://0.0.0.0:8000")
@@ -116,6 +139,14 @@ async def startup_event():
         # Don't raise - let server start for health checks
         pass
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist the semantic cache and stop the inference thread pool"""
+    if semantic_cache is not None and semantic_cache.enabled:
+        semantic_cache.save()
+    if executor is not None:
+        executor.shutdown(wait=False)
+
 # Health check endpoint
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -124,14 +155,128 @@ async def health_check():
     
     Returns:
         HealthResponse with service status and model/dataset availability
+        (the default pair can be served, even if it's currently evicted - see /stats)
     """
+    model_ok, dataset_ok = registry.is_available() if registry is not None else (False, False)
     return HealthResponse(
         status="healthy",
         service="Sehat Medical Chatbot",
-        model_loaded=model is not None,
-        dataset_loaded=emb_matrix is not None
+        model_loaded=model_ok,
+        dataset_loaded=dataset_ok
     )
 
+def run_inference(query: str, entry: IndexEntry) -> Tuple[str, float, str]:
+    """
+    Encode a query and find its best match, reusing cached answers for near-identical queries
+    
+    Returns:
+        (label, score, reply)
+    """
+    q_emb = encode_query(query, entry.model)
+    
+    key = (entry.model_name, entry.dataset_name)
+    use_cache = semantic_cache is not None and semantic_cache.applies_to(entry.emb_matrix.shape[0])
+    cached = None
+    if use_cache:
+        cached = semantic_cache.lookup(key, q_emb, entry.version)
+        # A sample of hits still gets the full scan to measure cache accuracy
+        if cached is not None and not semantic_cache.should_audit():
+            return cached.label, cached.score, cached.reply
+    
+    score, idx = search_index(q_emb, entry.emb_matrix)
+    
+    # Get the predicted disease label (handle missing labels safely)
+    try:
+        if entry.labels is not None:
+            label = entry.labels[idx]
+        elif entry.df is not None:
+            # fallback to dataframe label column
+            label = entry.df['label'].iloc[idx]
+        else:
+            label = "unknown"
+    except Exception:
+        # In case idx is out of range or any unexpected error, fallback to unknown
+        label = "unknown"
+    
+    # Generate friendly response
+    reply = friendly_response(label, score)
+    
+    if cached is not None:
+        semantic_cache.record_audit(cached, label)
+    elif use_cache:
+        semantic_cache.insert(key, q_emb, entry.version, CachedResult(label, score, reply))
+    
+    return label, score, reply
+
+# Shared inference path for /chat and /ws/chat
+async def answer_chat(request: ChatRequest) -> ChatResponse:
+    """
+    Validate a chat request, run it through the model and format the reply
+    
+    Raises:
+        HTTPException: if the service isn't ready or the model/dataset is unknown
+    """
+    # Validate registry is up
+    if registry is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service not ready. Model or dataset not loaded. Please restart the server."
+        )
+    
+    # Get and validate message
+    query = request.message.strip()
+    
+    if not query:
+        return ChatResponse(
+            reply="Please describe your symptoms so I can help you.",
+            confidence=0.0
+        )
+    
+    # Limit message length
+    if len(query) > MAX_MESSAGE_LENGTH:
+        return ChatResponse(
+            reply=f"Your message is too long. Please describe your symptoms in {MAX_MESSAGE_LENGTH} characters or less.",
+            confidence=0.0
+        )
+    
+    # Resolve the requested model/dataset pair. Resident pairs are looked up on the
+    # event loop; only misses go to a thread, so slow loads can't hold up the rest.
+    try:
+        entry = registry.get_resident(request.model, request.dataset)
+        if entry is None:
+            entry = await asyncio.to_thread(registry.get, request.model, request.dataset)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ModelLoadError as e:
+        # Dataset/model missing or a recent load failed (retried after a back-off)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service not ready. Model or dataset not loaded: {e}"
+        )
+    
+    print(f"💬 Query [{entry.model_name}/{entry.dataset_name}]: {query[:50]}...")
+    
+    # Encode, match and format on the sized inference pool
+    loop = asyncio.get_running_loop()
+    label, score, response = await loop.run_in_executor(
+        executor, run_inference, query, entry
+    )
+    
+    print(f"✅ Response: {label} (confidence: {score:.2f})")
+    
+    return ChatResponse(
+        reply=response,
+        confidence=round(score, 2)
+    )
+
+def record_chat(channel: str, started: float, error: bool = False) -> None:
+    """Update per-channel request counters and latency"""
+    stats = chat_metrics[channel]
+    stats["requests"] += 1
+    if error:
+        stats["errors"] += 1
+    stats["total_latency_ms"] += (time.perf_counter() - started) * 1000
+
 # Main chat endpoint - Optimized for speed
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -144,68 +289,98 @@ async def chat(request: ChatRequest):
     Returns:
         ChatResponse with AI-generated reply and confidence score
     """
+    started = time.perf_counter()
     try:
-        # Validate models are loaded
-        if model is None or emb_matrix is None:
-            raise HTTPException(
-                status_code=503,
-                detail="Service not ready. Model or dataset not loaded. Please restart the server."
-            )
-        
-        # Get and validate message
-        query = request.message.strip()
-        
-        if not query:
-            return ChatResponse(
-                reply="Please describe your symptoms so I can help you.",
-                confidence=0.0
-            )
-        
-        # Limit message length
-        if len(query) > 500:
-            return ChatResponse(
-                reply="Your message is too long. Please describe your symptoms in 500 characters or less.",
-                confidence=0.0
-            )
-        
-        print(f"💬 Query: {query[:50]}...")
-        
-        # Process in async manner for better performance
-        # Get similarity score and index
-        score, idx = most_similar(query, model, emb_matrix)
-        
-        # Get the predicted disease label (handle missing labels safely)
-        try:
-            if labels is not None:
-                label = labels[idx]
-            elif df is not None:
-                # fallback to dataframe label column
-                label = df['label'].iloc[idx]
-            else:
-                label = "unknown"
-        except Exception:
-            # In case idx is out of range or any unexpected error, fallback to unknown
-            label = "unknown"
-        
-        # Generate friendly response
-        response = friendly_response(label, score)
-        
-        print(f"✅ Response: {label} (confidence: {score:.2f})")
-        
-        return ChatResponse(
-            reply=response,
-            confidence=round(score, 2)
-        )
+        response = await answer_chat(request)
+        record_chat("http", started)
+        return response
         
     except HTTPException:
+        record_chat("http", started, error=True)
         raise
     except Exception as e:
+        record_chat("http", started, error=True)
         print(f"❌ Error processing request: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
 
+# Persistent chat channel - one connection per app session
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    WebSocket version of /chat for high-latency mobile links
+    
+    Each frame is a JSON ChatRequest plus an optional client-chosen "id":
+        {"id": "42", "message": "I have fever and headache"}
+    Messages are pipelined: several may be in flight at once and replies are
+    sent as soon as they are ready, echoing the "id" so the client can match them:
+        {"id": "42", "reply": "...", "confidence": 0.87}
+        {"id": "43", "error": "...", "status_code": 404}
+    """
+    await websocket.accept()
+    ws_stats = chat_metrics["websocket"]
+    ws_stats["connections"] += 1
+    ws_stats["active_connections"] += 1
+    
+    send_lock = asyncio.Lock()
+    in_flight = asyncio.Semaphore(WS_MAX_IN_FLIGHT)
+    tasks = set()
+    
+    async def send(payload: dict):
+        async with send_lock:
+            await websocket.send_json(payload)
+    
+    async def handle(data: dict):
+        started = time.perf_counter()
+        message_id = data.get("id")
+        try:
+            try:
+                request = ChatRequest(**{k: v for k, v in data.items() if k != "id"})
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+            response = await answer_chat(request)
+            record_chat("websocket", started)
+            await send({"id": message_id, **response.model_dump()})
+        except HTTPException as e:
+            record_chat("websocket", started, error=True)
+            await send({"id": message_id, "error": e.detail, "status_code": e.status_code})
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            record_chat("websocket", started, error=True)
+            print(f"❌ Error processing websocket message: {e}")
+            try:
+                await send({"id": message_id, "error": f"Internal server error: {str(e)}", "status_code": 500})
+            except Exception:
+                pass
+        finally:
+            in_flight.release()
+    
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except (ValueError, KeyError):
+                await send({"id": None, "error": "Frames must be JSON objects", "status_code": 400})
+                continue
+            if not isinstance(data, dict):
+                await send({"id": None, "error": "Frames must be JSON objects", "status_code": 400})
+                continue
+            
+            # Back-pressure: stop reading once too many messages are in flight
+            await in_flight.acquire()
+            task = asyncio.create_task(handle(data))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_stats["active_connections"] -= 1
+        for task in tasks:
+            task.cancel()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -219,13 +394,16 @@ async def root():
         "endpoints": {
             "health": "/health (GET) - Health check",
             "chat": "/chat (POST) - Send symptom query",
+            "chat_ws": "/ws/chat (WebSocket) - Persistent chat channel, JSON frames like /chat plus optional \"id\"",
             "docs": "/docs (GET) - Interactive API documentation"
         },
         "example_request": {
             "url": "/chat",
             "method": "POST",
             "body": {
-                "message": "I have fever and headache"
+                "message": "I have fever and headache",
+                "model": "(optional) model alias, see /stats",
+                "dataset": "(optional) dataset alias, see /stats"
             }
         }
     }
@@ -234,19 +412,25 @@ async def root():
 @app.get("/stats")
 async def get_stats():
     """
-    Get statistics about the dataset and model
+    Get statistics about the default dataset/model and all resident models
     """
-    if df is None or emb_matrix is None:
+    if registry is None:
         raise HTTPException(status_code=503, detail="Service not ready")
     
+    # The default pair may have been evicted to make room for other models
+    entry = registry.peek()
+    
     # Get unique diseases
-    unique_diseases = df['label'].nunique() if df is not None else 0
+    unique_diseases = entry.df['label'].nunique() if entry is not None else 0
     
     return {
-        "total_records": len(df) if df is not None else 0,
+        "total_records": len(entry.df) if entry is not None else 0,
         "unique_diseases": unique_diseases,
-        "embedding_dimensions": emb_matrix.shape[1] if emb_matrix is not None else 0,
-        "model_name": "all-MiniLM-L6-v2"
+        "embedding_dimensions": entry.emb_matrix.shape[1] if entry is not None else 0,
+        "model_name": registry.models[registry.default_model],
+        "registry": registry.stats(),
+        "chat_metrics": chat_metrics,
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
     }
 
 # Main entry point - Optimized for production
@@ -259,12 +443,18 @@ if __name__ == "__main__":
         print("❌ Failed to import 'uvicorn'. Please install it with: pip install uvicorn")
         raise RuntimeError("uvicorn is required to run the server") from e
 
+    # Each worker is its own process with its own model and thread pools;
+    # threading_config tunes threads for a 1/workers share of the cores.
+    workers = load_threading_config().uvicorn_workers or 1
+
     uvicorn.run(
-        app, 
+        # Multiple workers need an import string so each process can load the app
+        "chat_api:app" if workers > 1 else app, 
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
         host="0.0.0.0", 
         port=8000,
         log_level="info",
         access_log=True,
-        workers=1,  # Single worker for model consistency
+        workers=workers,  # Default 1 for model consistency
         timeout_keep_alive=75,  # Keep connections alive longer
     )
@@ -0,0 +1,269 @@
+"""
+index_compaction.py
+
+Compacts the embedding index by merging near-duplicate rows within each label.
+
+Many rows in symptom2disease.csv are near-paraphrases of each other. Each one
+costs a row in `emb_matrix` and a dot product per query without adding much
+information. After `load_or_build_embeddings()`, rows of the same label whose
+cosine similarity is above a threshold are clustered and replaced by a single
+exemplar (the cluster medoid or its normalised centroid).
+
+Either pass a fixed similarity threshold, or a target compression ratio
+(original rows / kept rows) and let the threshold be searched for.
+
+Usage:
+    # Report size, speed and held-out top-1 accuracy for a compaction setting
+    python index_compaction.py --threshold 0.9
+    python index_compaction.py --ratio 2 --method centroid
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.9
+# Never merge rows less similar than this, even to reach a target ratio
+MIN_THRESHOLD = 0.5
+METHODS = ("medoid", "centroid")
+
+
+def _group_by_label(labels: List[str]) -> Dict[str, np.ndarray]:
+    groups: Dict[str, List[int]] = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(label, []).append(i)
+    return {label: np.array(rows) for label, rows in groups.items()}
+
+
+def _cluster(sims: np.ndarray, threshold: float) -> List[np.ndarray]:
+    """Greedy clustering: repeatedly take the row with most unassigned neighbours.
+
+    Neighbour counts are updated by subtracting the columns of each removed
+    cluster, so the whole pass is O(n^2) rather than O(n^3).
+    """
+    # Every row neighbours itself, even if rounding puts its self-similarity below 1.0
+    adjacency = (sims >= threshold) | np.eye(len(sims), dtype=bool)
+    counts = adjacency.sum(axis=1).astype(np.int64)
+    unassigned = np.ones(len(sims), dtype=bool)
+    clusters = []
+    while unassigned.any():
+        leader = int(np.argmax(np.where(unassigned, counts, -1)))
+        members = np.flatnonzero(adjacency[leader] & unassigned)
+        clusters.append(members)
+        unassigned[members] = False
+        counts -= adjacency[:, members].sum(axis=1)
+    return clusters
+
+
+def _count_kept(label_sims: List[np.ndarray], threshold: float) -> int:
+    return sum(len(_cluster(sims, threshold)) for sims in label_sims)
+
+
+def find_threshold(emb_matrix: np.ndarray, labels: List[str], target_ratio: float) -> float:
+    """Highest threshold whose compaction reaches `target_ratio` (or MIN_THRESHOLD)."""
+    groups = _group_by_label(labels)
+    label_sims = [emb_matrix[rows] @ emb_matrix[rows].T for rows in groups.values()]
+    target_rows = len(labels) / max(target_ratio, 1.0)
+
+    if _count_kept(label_sims, MIN_THRESHOLD) > target_rows:
+        print(f"⚠️ Ratio {target_ratio} not reachable above similarity {MIN_THRESHOLD}")
+        return MIN_THRESHOLD
+
+    lo, hi = MIN_THRESHOLD, 1.0
+    for _ in range(20):
+        mid = (lo + hi) / 2
+        if _count_kept(label_sims, mid) <= target_rows:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def compact_index(
+    emb_matrix: np.ndarray,
+    labels: List[str],
+    threshold: Optional[float] = None,
+    target_ratio: Optional[float] = None,
+    method: str = "medoid",
+) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Merge near-duplicate rows per label into exemplars.
+
+    Returns (compacted embeddings, their labels, source row of each exemplar).
+    For centroids the source row is the cluster member closest to the centroid.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    if threshold is None:
+        threshold = find_threshold(emb_matrix, labels, target_ratio) if target_ratio else DEFAULT_THRESHOLD
+
+    exemplars, exemplar_labels, source_rows = [], [], []
+    for label, rows in _group_by_label(labels).items():
+        vectors = emb_matrix[rows]
+        sims = vectors @ vectors.T
+        for members in _cluster(sims, threshold):
+            if method == "centroid":
+                centroid = vectors[members].mean(axis=0)
+                centroid = centroid / (np.linalg.norm(centroid) + 1e-12)
+                exemplars.append(centroid)
+                closest = members[int(np.argmax(vectors[members] @ centroid))]
+                source_rows.append(rows[closest])
+            else:
+                medoid = members[int(np.argmax(sims[np.ix_(members, members)].sum(axis=1)))]
+                exemplars.append(vectors[medoid])
+                source_rows.append(rows[medoid])
+            exemplar_labels.append(label)
+
+    compacted = np.vstack(exemplars).astype(emb_matrix.dtype, copy=False)
+    return compacted, exemplar_labels, np.array(source_rows)
+
+
+def load_or_compact_index(
+    emb_matrix: np.ndarray,
+    labels: List[str],
+    index_key: str,
+    threshold: Optional[float] = None,
+    target_ratio: Optional[float] = None,
+    method: str = "medoid",
+    cache_dir: str = ".cache",
+) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    compact_index() with the result stored next to the embeddings cache.
+
+    `index_key` must change whenever the embeddings do (e.g. the registry's
+    index version); the compaction settings are added to it here.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    st = f"{index_key}|{threshold}|{target_ratio}|{method}"
+    key = hashlib.sha256(st.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(cache_dir, f"compacted_{key}.npz")
+
+    if os.path.isfile(cache_path):
+        try:
+            data = np.load(cache_path)
+            source_rows = data["source_rows"]
+            if int(data["original_rows"]) == len(labels) and source_rows.max(initial=-1) < len(labels):
+                return data["embeddings"], [labels[i] for i in source_rows], source_rows
+        except Exception:
+            pass
+
+    compacted, compacted_labels, source_rows = compact_index(
+        emb_matrix, labels, threshold, target_ratio, method
+    )
+    try:
+        np.savez_compressed(
+            cache_path, embeddings=compacted, source_rows=source_rows, original_rows=len(labels)
+        )
+    except Exception:
+        pass
+    return compacted, compacted_labels, source_rows
+
+
+# -----------------------------------------------------------
+# 📏 Evaluation
+# -----------------------------------------------------------
+def _top1_accuracy(index: np.ndarray, index_labels: List[str], queries: np.ndarray, query_labels: List[str]) -> float:
+    predicted = np.argmax(queries @ index.T, axis=1)
+    return float(np.mean([index_labels[p] == t for p, t in zip(predicted, query_labels)]))
+
+
+def _search_ms(index: np.ndarray, queries: np.ndarray, repeats: int = 20) -> float:
+    """Median time of one single-query scan over `index`, in milliseconds."""
+    samples = []
+    for i in range(repeats):
+        q = queries[i % len(queries)][None, :]
+        start = time.perf_counter()
+        np.argmax(index @ q.T)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def evaluate_compaction(
+    emb_matrix: np.ndarray,
+    labels: List[str],
+    threshold: Optional[float] = None,
+    target_ratio: Optional[float] = None,
+    method: str = "medoid",
+    test_size: float = 0.2,
+    seed: int = 42,
+) -> dict:
+    """Compact a training split and compare it with the full split on held-out rows."""
+    if not 0 < test_size < 1:
+        raise ValueError(f"test_size must be between 0 and 1, got {test_size}")
+    rng = np.random.default_rng(seed)
+    train_rows, test_rows = [], []
+    # Stratified split so every label is represented on both sides: labels with
+    # at least two rows hold out at least one and keep at least one for training
+    for rows in _group_by_label(labels).values():
+        rows = rng.permutation(rows)
+        n_test = min(max(int(round(len(rows) * test_size)), 1), len(rows) - 1)
+        test_rows.extend(rows[:n_test])
+        train_rows.extend(rows[n_test:])
+    if not test_rows:
+        raise ValueError("No rows to hold out: every label has a single row")
+
+    train, train_labels = emb_matrix[train_rows], [labels[i] for i in train_rows]
+    test, test_labels = emb_matrix[test_rows], [labels[i] for i in test_rows]
+
+    if threshold is None:
+        threshold = find_threshold(train, train_labels, target_ratio) if target_ratio else DEFAULT_THRESHOLD
+    compacted, compacted_labels, _ = compact_index(train, train_labels, threshold, method=method)
+
+    full_ms = _search_ms(train, test)
+    compact_ms = _search_ms(compacted, test)
+    return {
+        "method": method,
+        "threshold": threshold,
+        "rows_before": len(train),
+        "rows_after": len(compacted),
+        "compression_ratio": round(len(train) / max(len(compacted), 1), 2),
+        "bytes_before": int(train.nbytes),
+        "bytes_after": int(compacted.nbytes),
+        "search_ms_before": round(full_ms, 4),
+        "search_ms_after": round(compact_ms, 4),
+        "speedup": round(full_ms / compact_ms, 2) if compact_ms > 0 else None,
+        "held_out_rows": len(test),
+        "top1_accuracy_before": round(_top1_accuracy(train, train_labels, test, test_labels), 4),
+        "top1_accuracy_after": round(_top1_accuracy(compacted, compacted_labels, test, test_labels), 4),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Evaluate embedding index compaction")
+    p.add_argument("--threshold", type=float, default=None, help=f"Cosine similarity to merge rows (default: {DEFAULT_THRESHOLD})")
+    p.add_argument("--ratio", type=float, default=None, help="Target compression ratio, e.g. 2 = keep half the rows")
+    p.add_argument("--method", choices=METHODS, default="medoid", help="Exemplar kept per cluster")
+    p.add_argument("--model", default=None, help="Registry model alias (default: registry default)")
+    p.add_argument("--test-size", type=float, default=0.2, help="Held-out fraction per label (0 < x < 1)")
+    args = p.parse_args()
+    if not 0 < args.test_size < 1:
+        p.error("--test-size must be between 0 and 1 (exclusive)")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    from model_registry import ModelRegistry
+
+    # Evaluate against the uncompacted index, whatever the server is configured with
+    entry = ModelRegistry.from_env(compact_threshold=None, compact_ratio=None).get(args.model)
+    print(f"📏 Evaluating compaction on {entry.emb_matrix.shape[0]} rows ({entry.model_name}/{entry.dataset_name})...")
+    report = evaluate_compaction(
+        entry.emb_matrix, entry.labels, args.threshold, args.ratio, args.method, args.test_size
+    )
+
+    print(f"  Threshold:       {report['threshold']:.3f} ({report['method']})")
+    print(f"  Rows:            {report['rows_before']} -> {report['rows_after']} ({report['compression_ratio']}x smaller)")
+    print(f"  Memory:          {report['bytes_before'] / 1024:.1f} KB -> {report['bytes_after'] / 1024:.1f} KB")
+    print(f"  Search latency:  {report['search_ms_before']:.4f} ms -> {report['search_ms_after']:.4f} ms ({report['speedup']}x faster)")
+    print(f"  Top-1 accuracy:  {report['top1_accuracy_before']:.2%} -> {report['top1_accuracy_after']:.2%} "
+          f"on {report['held_out_rows']} held-out rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,9 @@ from sklearn.metrics.pairwise import cosine_similarity
 # 🆕 KaggleHub for dataset download
 import kagglehub
 
+# Default sentence-transformer used when no model is configured
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
 
 # -----------------------------------------------------------
 # 🧩 Dataset Management with Smart Caching
@@ -108,10 +111,16 @@ def compute_cache_key(csv_path: str, model_id: str) -> str:
 
 
 def load_or_build_embeddings(
-    df: pd.DataFrame, model: SentenceTransformer, csv_path: str, cache_dir: str = ".cache"
+    df: pd.DataFrame,
+    model: SentenceTransformer,
+    csv_path: str,
+    cache_dir: str = ".cache",
+    model_id: Optional[str] = None,
 ) -> Tuple[np.ndarray, List[str]]:
     os.makedirs(cache_dir, exist_ok=True)
-    model_id = getattr(model, "name", None) or getattr(model, "model_name", "model")
+    # Pass model_id explicitly when several models share a cache_dir, otherwise
+    # their embeddings end up under the same key.
+    model_id = model_id or getattr(model, "name", None) or getattr(model, "model_name", "model")
     key = compute_cache_key(csv_path, model_id)
     cache_path = os.path.join(cache_dir, f"embeddings_{key}.npz")
 
@@ -140,15 +149,23 @@ def load_or_build_embeddings(
     return emb, labels
 
 
-def most_similar(query: str, model: SentenceTransformer, emb_matrix: np.ndarray) -> Tuple[float, int]:
+def encode_query(query: str, model: SentenceTransformer) -> np.ndarray:
+    """Encode a single query as a unit-length (1, dim) vector."""
     q_emb = model.encode([query], convert_to_numpy=True)
-    q_emb = q_emb / (np.linalg.norm(q_emb, axis=1, keepdims=True) + 1e-12)
+    return q_emb / (np.linalg.norm(q_emb, axis=1, keepdims=True) + 1e-12)
+
+
+def search_index(q_emb: np.ndarray, emb_matrix: np.ndarray) -> Tuple[float, int]:
     sims = (emb_matrix @ q_emb.T).squeeze(1)
     idx = int(np.argmax(sims))
     score = float(sims[idx])
     return score, idx
 
 
+def most_similar(query: str, model: SentenceTransformer, emb_matrix: np.ndarray) -> Tuple[float, int]:
+    return search_index(encode_query(query, model), emb_matrix)
+
+
 # -----------------------------------------------------------
 # 💬 Chatbot Logic
 # -----------------------------------------------------------
@@ -212,6 +229,7 @@ def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Medical symptom-checker chatbot")
     p.add_argument("--csv", default=None, help="Path to symptom CSV (optional)")
     p.add_argument("--local-model", default=os.environ.get("SENTENCE_TRANSFORMER_LOCAL_PATH"), help="Local model path")
+    p.add_argument("--model", default=DEFAULT_MODEL_NAME, help="Sentence-transformer model name (ignored if --local-model is set)")
     p.add_argument("--threshold", type=float, default=0.55, help="Similarity threshold")
     return p.parse_args()
 
@@ -229,7 +247,7 @@ def main() -> None:
         print("❌ Could not locate or download the dataset. Please check your internet connection.")
         return
 
-    model_source = args.local_model or "all-MiniLM-L6-v2"
+    model_source = args.local_model or args.model
     print(f"Loading embedding model from: {model_source}")
     try:
         model = SentenceTransformer(model_source)
@@ -0,0 +1,473 @@
+"""
+model_registry.py
+
+On-demand registry of sentence-transformer models and their embedding indexes
+for the SehatConnect chatbot backend.
+
+Models and datasets are addressed by short aliases so that one process can
+serve e.g. a small English model and a larger multilingual one (Hindi/Punjabi)
+over several datasets. Each (model, dataset) pair is loaded the first time it
+is requested, models are shared between indexes, and everything resident is
+kept under a memory budget with least-recently-used eviction.
+
+Configuration (environment variables):
+    SEHAT_MODELS            alias=source pairs, e.g.
+                            "mini=all-MiniLM-L6-v2,multilingual=paraphrase-multilingual-MiniLM-L12-v2"
+    SEHAT_DATASETS          alias=csv_path pairs, e.g. "symptom2disease=./symptom2disease.csv"
+    SEHAT_DEFAULT_MODEL     alias used when a request doesn't name a model
+    SEHAT_DEFAULT_DATASET   alias used when a request doesn't name a dataset
+    SEHAT_MEMORY_BUDGET_MB  memory budget for resident models + indexes (default: 2048)
+    SEHAT_COMPACT_THRESHOLD merge same-label rows above this cosine similarity (see index_compaction.py)
+    SEHAT_COMPACT_RATIO     or: target compression ratio, e.g. 2 = keep about half the rows
+    SEHAT_COMPACT_METHOD    exemplar kept per cluster: "medoid" (default) or "centroid"
+"""
+
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+from medical_chatbot import (
+    DEFAULT_MODEL_NAME,
+    compute_cache_key,
+    ensure_dataset_available,
+    load_dataset,
+    load_or_build_embeddings,
+)
+from index_compaction import load_or_compact_index
+
+DEFAULT_MODELS = {
+    "mini": os.environ.get("SENTENCE_TRANSFORMER_LOCAL_PATH") or DEFAULT_MODEL_NAME,
+    "multilingual": "paraphrase-multilingual-MiniLM-L12-v2",
+}
+# A dataset path of None means "use ensure_dataset_available()"
+DEFAULT_DATASETS: Dict[str, Optional[str]] = {"symptom2disease": None}
+DEFAULT_MEMORY_BUDGET_MB = 2048
+_MB = 1024 * 1024
+# After a failed load, requests for the same model/index fail fast for this long
+LOAD_RETRY_SECONDS = 60
+
+
+class ModelLoadError(RuntimeError):
+    """A model or index could not be loaded (or a recent load failed and is backing off)."""
+
+
+@dataclass
+class LoadedModel:
+    name: str
+    source: str
+    model: SentenceTransformer
+    nbytes: int
+
+
+@dataclass
+class LoadedIndex:
+    model_name: str
+    dataset_name: str
+    csv_path: str
+    df: pd.DataFrame
+    emb_matrix: np.ndarray
+    labels: List[str]
+    nbytes: int
+    original_rows: int
+    version: str
+
+
+@dataclass
+class IndexEntry:
+    """A resident model + index pair, as handed out to request handlers."""
+    model_name: str
+    dataset_name: str
+    model: SentenceTransformer
+    df: pd.DataFrame
+    emb_matrix: np.ndarray
+    labels: List[str]
+    csv_path: str
+    # Changes whenever the dataset, model or compaction settings change
+    version: str
+
+
+def parse_alias_list(value: Optional[str]) -> Dict[str, str]:
+    """Parse "alias=source,alias2=source2" into a dict (empty/invalid parts are skipped)."""
+    result: Dict[str, str] = {}
+    if not value:
+        return result
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+        alias, source = part.split("=", 1)
+        if alias.strip() and source.strip():
+            result[alias.strip()] = source.strip()
+    return result
+
+
+def model_nbytes(model: SentenceTransformer) -> int:
+    """Approximate resident size of a model from its parameters and buffers."""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return int(total)
+    except Exception:
+        return 0
+
+
+def index_nbytes(df: pd.DataFrame, emb_matrix: np.ndarray) -> int:
+    """Approximate resident size of an index (embeddings + dataframe)."""
+    size = int(emb_matrix.nbytes)
+    try:
+        size += int(df.memory_usage(deep=True).sum())
+    except Exception:
+        pass
+    return size
+
+
+class ModelRegistry:
+    """Loads model+index pairs on demand and evicts the least recently used ones."""
+
+    def __init__(
+        self,
+        models: Optional[Dict[str, str]] = None,
+        datasets: Optional[Dict[str, Optional[str]]] = None,
+        default_model: Optional[str] = None,
+        default_dataset: Optional[str] = None,
+        memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+        compact_threshold: Optional[float] = None,
+        compact_ratio: Optional[float] = None,
+        compact_method: str = "medoid",
+    ):
+        self.models = dict(models or DEFAULT_MODELS)
+        self.datasets = dict(datasets or DEFAULT_DATASETS)
+        self.default_model = default_model or next(iter(self.models))
+        self.default_dataset = default_dataset or next(iter(self.datasets))
+        self.memory_budget_bytes = int(memory_budget_mb * _MB)
+        self.compact_threshold = compact_threshold
+        self.compact_ratio = compact_ratio
+        self.compact_method = compact_method
+
+        if self.default_model not in self.models:
+            raise ValueError(f"Default model '{self.default_model}' is not configured")
+        if self.default_dataset not in self.datasets:
+            raise ValueError(f"Default dataset '{self.default_dataset}' is not configured")
+
+        # Keys are ("model", model_name) or ("index", model_name, dataset_name);
+        # order is least -> most recently used.
+        self._resident: "OrderedDict[tuple, object]" = OrderedDict()
+        # Guards _resident and the bookkeeping below; never held while loading
+        self._lock = threading.Lock()
+        # One lock per key being loaded, so only requests for that key wait
+        self._loading_locks: Dict[tuple, threading.Lock] = {}
+        # key -> (monotonic time to retry at, error message)
+        self._failures: Dict[tuple, Tuple[float, str]] = {}
+        # Keys that have loaded successfully at least once (see is_available)
+        self._loaded_once: set = set()
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ModelRegistry":
+        """Build a registry from SEHAT_* environment variables; keyword arguments win."""
+        models = parse_alias_list(os.environ.get("SEHAT_MODELS")) or None
+        datasets = parse_alias_list(os.environ.get("SEHAT_DATASETS")) or None
+        budget = float(os.environ.get("SEHAT_MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET_MB))
+        compact_threshold = os.environ.get("SEHAT_COMPACT_THRESHOLD")
+        compact_ratio = os.environ.get("SEHAT_COMPACT_RATIO")
+        kwargs = dict(
+            models=models,
+            datasets=datasets,
+            default_model=os.environ.get("SEHAT_DEFAULT_MODEL"),
+            default_dataset=os.environ.get("SEHAT_DEFAULT_DATASET"),
+            memory_budget_mb=budget,
+            compact_threshold=float(compact_threshold) if compact_threshold else None,
+            compact_ratio=float(compact_ratio) if compact_ratio else None,
+            compact_method=os.environ.get("SEHAT_COMPACT_METHOD", "medoid"),
+        )
+        kwargs.update(overrides)
+        return cls(**kwargs)
+
+    # -------------------------------------------------------
+    # Lookup
+    # -------------------------------------------------------
+    def resolve(self, model_name: Optional[str], dataset_name: Optional[str]) -> Tuple[str, str]:
+        """Apply defaults and validate aliases. Raises KeyError for unknown aliases."""
+        model_name = model_name or self.default_model
+        dataset_name = dataset_name or self.default_dataset
+        if model_name not in self.models:
+            raise KeyError(f"Unknown model '{model_name}'. Available: {', '.join(self.models)}")
+        if dataset_name not in self.datasets:
+            raise KeyError(f"Unknown dataset '{dataset_name}'. Available: {', '.join(self.datasets)}")
+        return model_name, dataset_name
+
+    def get(self, model_name: Optional[str] = None, dataset_name: Optional[str] = None) -> IndexEntry:
+        """Return a resident model + index pair, loading (and evicting) as needed.
+
+        Only requests for a pair that is being loaded wait for it; resident pairs
+        are returned straight away. Raises ModelLoadError if the load fails, and
+        while a failed load is backing off.
+        """
+        model_name, dataset_name = self.resolve(model_name, dataset_name)
+        loaded_model = self._get_model(model_name)
+        loaded_index = self._get_index(loaded_model, dataset_name)
+        return self._entry(loaded_model, loaded_index)
+
+    def get_resident(self, model_name: Optional[str] = None, dataset_name: Optional[str] = None) -> Optional[IndexEntry]:
+        """Like get(), but returns None instead of loading anything.
+
+        Marks the pair most recently used. Never waits on a load, so it is safe
+        to call from the event loop; only misses need a thread for get().
+        """
+        model_name, dataset_name = self.resolve(model_name, dataset_name)
+        loaded_model = self._touch(("model", model_name))
+        loaded_index = self._touch(("index", model_name, dataset_name))
+        if loaded_model is None or loaded_index is None:
+            return None
+        return self._entry(loaded_model, loaded_index)
+
+    def peek(self, model_name: Optional[str] = None, dataset_name: Optional[str] = None) -> Optional[IndexEntry]:
+        """Like get(), but never loads anything and doesn't touch LRU order.
+
+        Doesn't take the lock, so health/stats checks never wait on a slow load.
+        """
+        try:
+            model_name, dataset_name = self.resolve(model_name, dataset_name)
+        except KeyError:
+            return None
+        loaded_model = self._resident.get(("model", model_name))
+        loaded_index = self._resident.get(("index", model_name, dataset_name))
+        if loaded_model is None or loaded_index is None:
+            return None
+        return self._entry(loaded_model, loaded_index)
+
+    def is_available(self, model_name: Optional[str] = None, dataset_name: Optional[str] = None) -> Tuple[bool, bool]:
+        """(model, index) can be served: resident, or evicted after a successful load.
+
+        Evicted entries reload on the next request, so only a failed load (until
+        it succeeds again) or one that never happened counts as unavailable.
+        """
+        try:
+            model_name, dataset_name = self.resolve(model_name, dataset_name)
+        except KeyError:
+            return False, False
+        with self._lock:
+            return (
+                self._available(("model", model_name)),
+                self._available(("index", model_name, dataset_name)),
+            )
+
+    def _available(self, key: tuple) -> bool:
+        """Call with self._lock held."""
+        return key in self._resident or (key in self._loaded_once and key not in self._failures)
+
+    @staticmethod
+    def _entry(loaded_model: LoadedModel, loaded_index: LoadedIndex) -> IndexEntry:
+        return IndexEntry(
+            model_name=loaded_model.name,
+            dataset_name=loaded_index.dataset_name,
+            model=loaded_model.model,
+            df=loaded_index.df,
+            emb_matrix=loaded_index.emb_matrix,
+            labels=loaded_index.labels,
+            csv_path=loaded_index.csv_path,
+            version=loaded_index.version,
+        )
+
+    # -------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------
+    def _touch(self, key: tuple):
+        """Return a resident entry (marking it most recently used), or None."""
+        with self._lock:
+            item = self._resident.get(key)
+            if item is not None:
+                self._resident.move_to_end(key)
+            return item
+
+    def _key_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._loading_locks.setdefault(key, threading.Lock())
+
+    def _check_backoff(self, key: tuple) -> None:
+        with self._lock:
+            failure = self._failures.get(key)
+        if failure is not None:
+            retry_at, message = failure
+            remaining = retry_at - time.monotonic()
+            if remaining > 0:
+                raise ModelLoadError(f"{message} (retrying in {remaining:.0f}s)")
+
+    def _record_failure(self, key: tuple, error: Exception) -> ModelLoadError:
+        """Remember a failed load for back-off and return the error to raise for it."""
+        message = f"Failed to load {key[0]} {'/'.join(key[1:])}: {error}"
+        with self._lock:
+            self._failures[key] = (time.monotonic() + LOAD_RETRY_SECONDS, message)
+        print(f"❌ {message}")
+        return ModelLoadError(message)
+
+    def _get_model(self, model_name: str) -> LoadedModel:
+        key = ("model", model_name)
+        loaded = self._touch(key)
+        if loaded is not None:
+            return loaded
+
+        with self._key_lock(key):
+            # Someone else may have finished loading while we waited
+            loaded = self._touch(key)
+            if loaded is not None:
+                return loaded
+            self._check_backoff(key)
+
+            source = self.models[model_name]
+            print(f"📥 Loading model '{model_name}' from: {source}")
+            try:
+                model = SentenceTransformer(source)
+            except Exception as e:
+                raise self._record_failure(key, e) from e
+            loaded = LoadedModel(name=model_name, source=source, model=model, nbytes=model_nbytes(model))
+
+            with self._lock:
+                self._failures.pop(key, None)
+                self._loaded_once.add(key)
+                self._make_room(loaded.nbytes, pinned=set())
+                self._resident[key] = loaded
+            print(f"✅ Model '{model_name}' loaded ({loaded.nbytes / _MB:.1f} MB)")
+            return loaded
+
+    def _get_index(self, loaded_model: LoadedModel, dataset_name: str) -> LoadedIndex:
+        key = ("index", loaded_model.name, dataset_name)
+        model_key = ("model", loaded_model.name)
+        loaded = self._touch(key)
+        if loaded is not None:
+            return loaded
+
+        with self._key_lock(key):
+            loaded = self._touch(key)
+            if loaded is not None:
+                return loaded
+            self._check_backoff(key)
+
+            try:
+                loaded = self._load_index(loaded_model, dataset_name)
+            except Exception as e:
+                # Remember the failure so requests don't retry a download each time
+                raise self._record_failure(key, e) from e
+
+            with self._lock:
+                self._failures.pop(key, None)
+                self._loaded_once.add(key)
+                # The model may have been evicted while the index was building;
+                # it's in use again, so put it back before the eviction pass.
+                self._resident.setdefault(model_key, loaded_model)
+                self._make_room(loaded.nbytes, pinned={model_key})
+                self._resident[key] = loaded
+                self._resident.move_to_end(model_key)
+            print(f"✅ Index '{loaded_model.name}/{dataset_name}' ready: {loaded.emb_matrix.shape}")
+            return loaded
+
+    def _load_index(self, loaded_model: LoadedModel, dataset_name: str) -> LoadedIndex:
+        """Read, embed and (optionally) compact a dataset. Runs without the registry lock."""
+        csv_path = self.datasets[dataset_name] or ensure_dataset_available()
+        if csv_path is None or not os.path.isfile(csv_path):
+            raise FileNotFoundError(f"Dataset '{dataset_name}' not available")
+
+        print(f"📊 Loading dataset '{dataset_name}' from: {csv_path}")
+        df = load_dataset(csv_path)
+        emb_matrix, labels = load_or_build_embeddings(
+            df, loaded_model.model, csv_path, model_id=loaded_model.source
+        )
+        original_rows = emb_matrix.shape[0]
+        version = self._index_version(csv_path, loaded_model.source)
+        if self.compact_threshold or self.compact_ratio:
+            # Cached on disk, so reloads (e.g. after LRU eviction) skip the clustering
+            emb_matrix, labels, source_rows = load_or_compact_index(
+                emb_matrix, labels, version,
+                self.compact_threshold, self.compact_ratio, self.compact_method,
+            )
+            # Keep df row-aligned with emb_matrix (one exemplar row per index row)
+            df = df.iloc[source_rows].reset_index(drop=True)
+            print(f"🗜️ Index compacted: {original_rows} -> {emb_matrix.shape[0]} rows "
+                  f"({original_rows / max(emb_matrix.shape[0], 1):.2f}x smaller)")
+        return LoadedIndex(
+            model_name=loaded_model.name,
+            dataset_name=dataset_name,
+            csv_path=csv_path,
+            df=df,
+            emb_matrix=emb_matrix,
+            labels=labels,
+            nbytes=index_nbytes(df, emb_matrix),
+            original_rows=original_rows,
+            version=version,
+        )
+
+    def _index_version(self, csv_path: str, model_source: str) -> str:
+        compaction = f"{self.compact_threshold}|{self.compact_ratio}|{self.compact_method}"
+        return compute_cache_key(csv_path, f"{model_source}|{compaction}")[:16]
+
+    # -------------------------------------------------------
+    # Eviction
+    # -------------------------------------------------------
+    def used_bytes(self) -> int:
+        return sum(item.nbytes for item in list(self._resident.values()))
+
+    def _make_room(self, incoming: int, pinned: set) -> None:
+        """Evict least recently used entries until `incoming` bytes fit the budget.
+
+        Call with self._lock held.
+        """
+        while self._resident and self.used_bytes() + incoming > self.memory_budget_bytes:
+            victim = next((k for k in self._resident if k not in pinned), None)
+            if victim is None:
+                break
+            self._evict(victim)
+        if self.used_bytes() + incoming > self.memory_budget_bytes:
+            print(f"⚠️ Memory budget exceeded: {(self.used_bytes() + incoming) / _MB:.1f} MB "
+                  f"> {self.memory_budget_bytes / _MB:.1f} MB")
+
+    def _evict(self, key: tuple) -> None:
+        self._resident.pop(key, None)
+        self.evictions += 1
+        print(f"♻️ Evicted {key[0]} {'/'.join(key[1:])}")
+        if key[0] == "model":
+            # Indexes built on this model keep a reference to it - drop them too
+            # so the memory is actually released.
+            for other in [k for k in self._resident if k[0] == "index" and k[1] == key[1]]:
+                self._resident.pop(other, None)
+                self.evictions += 1
+                print(f"♻️ Evicted index {'/'.join(other[1:])}")
+
+    # -------------------------------------------------------
+    # Reporting
+    # -------------------------------------------------------
+    def stats(self) -> dict:
+        # Snapshot instead of locking so /stats stays responsive during a load
+        resident = list(self._resident.items())
+        resident_models = [
+            {"name": item.name, "source": item.source, "memory_mb": round(item.nbytes / _MB, 1)}
+            for key, item in resident if key[0] == "model"
+        ]
+        resident_indexes = [
+            {
+                "model": item.model_name,
+                "dataset": item.dataset_name,
+                "records": int(item.emb_matrix.shape[0]),
+                "records_before_compaction": item.original_rows,
+                "embedding_dimensions": int(item.emb_matrix.shape[1]),
+                "memory_mb": round(item.nbytes / _MB, 1),
+            }
+            for key, item in resident if key[0] == "index"
+        ]
+        return {
+            "available_models": dict(self.models),
+            "available_datasets": list(self.datasets),
+            "default_model": self.default_model,
+            "default_dataset": self.default_dataset,
+            "resident_models": resident_models,
+            "resident_indexes": resident_indexes,
+            "memory_used_mb": round(sum(item.nbytes for _, item in resident) / _MB, 1),
+            "memory_budget_mb": round(self.memory_budget_bytes / _MB, 1),
+            "evictions": self.evictions,
+        }
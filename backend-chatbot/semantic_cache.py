@@ -0,0 +1,239 @@
+"""
+semantic_cache.py
+
+Result cache keyed by query-vector neighbourhood.
+
+Queries that differ only trivially ("i have fever & headache" vs "fever and a
+headache") encode to nearly the same vector. After encoding, the query is
+compared against a small matrix of recently answered query vectors; if one is
+within a tight cosine radius and was answered by the same index version, its
+label/score/reply is reused and the full scan over `emb_matrix` is skipped.
+
+The cache is bounded per (model, dataset) with least-recently-used eviction,
+keeps hit-rate counters, and re-checks a sample of hits against the full scan
+to measure how often a reused answer differs. A lookup costs a scan over the
+cache itself, so it only pays off when the index is much larger than the cache;
+indexes with fewer rows than `min_index_rows` bypass it. With the defaults that
+includes the shipped ~1200-row symptom2disease index.
+
+Each bucket holds answers from a single index version; when the version
+changes the bucket is emptied rather than filtered on every lookup.
+
+Configuration (environment variables):
+    SEHAT_CACHE_SIZE            entries per (model, dataset); 0 disables (default: 1024)
+    SEHAT_CACHE_RADIUS          minimum cosine similarity for a hit (default: 0.97)
+    SEHAT_CACHE_AUDIT_RATE      fraction of hits re-checked with a full scan (default: 0.05)
+    SEHAT_CACHE_MIN_INDEX_ROWS  skip the cache for smaller indexes (default: 8 x cache size)
+    SEHAT_CACHE_PATH            file the cache is saved to on shutdown / loaded from on startup
+"""
+
+from __future__ import annotations
+import json
+import os
+import random
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_RADIUS = 0.97
+DEFAULT_AUDIT_RATE = 0.05
+DEFAULT_CACHE_PATH = os.path.join(".cache", "semantic_cache.npz")
+# The cache is only used for indexes at least this many times larger than it
+MIN_INDEX_ROWS_FACTOR = 8
+
+
+@dataclass
+class CachedResult:
+    label: str
+    score: float
+    reply: str
+
+
+class _Bucket:
+    """Fixed-size store of query vectors and results for one (model, dataset) and index version."""
+
+    def __init__(self, dim: int, max_size: int, version: str):
+        self.version = version
+        self.vectors = np.zeros((max_size, dim), dtype=np.float32)
+        self.results = [None] * max_size
+        self.last_used = np.zeros(max_size, dtype=np.int64)
+        self.size = 0
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        radius: float = DEFAULT_RADIUS,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+        min_index_rows: Optional[int] = None,
+        path: str = DEFAULT_CACHE_PATH,
+    ):
+        self.max_size = max_size
+        self.path = path
+        self.radius = radius
+        self.audit_rate = audit_rate
+        self.min_index_rows = max_size * MIN_INDEX_ROWS_FACTOR if min_index_rows is None else min_index_rows
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.counters = {
+            "lookups": 0, "hits": 0, "misses": 0, "bypassed": 0,
+            "evictions": 0, "audits": 0, "audit_mismatches": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        min_rows = os.environ.get("SEHAT_CACHE_MIN_INDEX_ROWS")
+        return cls(
+            max_size=int(os.environ.get("SEHAT_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+            radius=float(os.environ.get("SEHAT_CACHE_RADIUS", DEFAULT_RADIUS)),
+            audit_rate=float(os.environ.get("SEHAT_CACHE_AUDIT_RATE", DEFAULT_AUDIT_RATE)),
+            min_index_rows=int(min_rows) if min_rows else None,
+            path=os.environ.get("SEHAT_CACHE_PATH", DEFAULT_CACHE_PATH),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def applies_to(self, index_rows: int) -> bool:
+        """Whether a lookup is worth it for an index of this size."""
+        if not self.enabled or index_rows < self.min_index_rows:
+            with self._lock:
+                self.counters["bypassed"] += 1
+            return False
+        return True
+
+    def should_audit(self) -> bool:
+        return random.random() < self.audit_rate
+
+    # -------------------------------------------------------
+    # Lookup / insert
+    # -------------------------------------------------------
+    def lookup(self, key: Tuple[str, str], q_emb: np.ndarray, version: str) -> Optional[CachedResult]:
+        q = q_emb.ravel()
+        with self._lock:
+            self.counters["lookups"] += 1
+            bucket = self._buckets.get(key)
+            size = bucket.size if bucket is not None else 0
+            if bucket is None or size == 0 or bucket.version != version:
+                self.counters["misses"] += 1
+                return None
+
+        # The scan runs without the lock so concurrent lookups don't serialise on it
+        sims = bucket.vectors[:size] @ q
+        slot = int(np.argmax(sims))
+
+        with self._lock:
+            # An insert may have replaced the slot (or the bucket) meanwhile - re-check it
+            if (
+                self._buckets.get(key) is bucket
+                and float(bucket.vectors[slot] @ q) >= self.radius
+            ):
+                self._tick += 1
+                bucket.last_used[slot] = self._tick
+                self.counters["hits"] += 1
+                return bucket.results[slot]
+            self.counters["misses"] += 1
+            return None
+
+    def insert(self, key: Tuple[str, str], q_emb: np.ndarray, version: str, result: CachedResult) -> None:
+        if not self.enabled:
+            return
+        q = q_emb.ravel().astype(np.float32)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.version != version or bucket.vectors.shape[1] != q.shape[0]:
+                # New index version: answers from the old one are no longer valid
+                bucket = self._buckets[key] = _Bucket(q.shape[0], self.max_size, version)
+
+            if bucket.size < self.max_size:
+                slot = bucket.size
+                bucket.size += 1
+            else:
+                slot = int(np.argmin(bucket.last_used))
+                self.counters["evictions"] += 1
+
+            self._tick += 1
+            bucket.vectors[slot] = q
+            bucket.results[slot] = result
+            bucket.last_used[slot] = self._tick
+
+    def record_audit(self, cached: CachedResult, label: str) -> None:
+        with self._lock:
+            self.counters["audits"] += 1
+            if cached.label != label:
+                self.counters["audit_mismatches"] += 1
+
+    # -------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------
+    def save(self, path: Optional[str] = None) -> None:
+        """Write the cache to `path` atomically.
+
+        Every uvicorn worker saves on shutdown, so each writes a temporary file
+        and renames it into place; the last one wins instead of a corrupt file.
+        """
+        path = path or self.path
+        with self._lock:
+            arrays, meta = {}, []
+            for i, (key, bucket) in enumerate(self._buckets.items()):
+                n = bucket.size
+                arrays[f"vectors_{i}"] = bucket.vectors[:n].copy()
+                meta.append({
+                    "key": list(key),
+                    "version": bucket.version,
+                    "results": [[r.label, r.score, r.reply] for r in bucket.results[:n]],
+                })
+        tmp_path = None
+        try:
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".semantic_cache.", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ Could not save semantic cache: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, path: Optional[str] = None) -> int:
+        """Load a saved cache. Buckets from an old index version are replaced on first insert."""
+        path = path or self.path
+        if not self.enabled or not os.path.isfile(path):
+            return 0
+        loaded = 0
+        try:
+            data = np.load(path)
+            meta = json.loads(str(data["meta"]))
+            for i, item in enumerate(meta):
+                vectors = data[f"vectors_{i}"]
+                for vector, (label, score, reply) in zip(vectors, item["results"]):
+                    self.insert(tuple(item["key"]), vector, item["version"], CachedResult(label, score, reply))
+                    loaded += 1
+        except Exception as e:
+            print(f"⚠️ Could not load semantic cache: {e}")
+        return loaded
+
+    def stats(self) -> dict:
+        # insert() may add buckets from executor threads while this runs on the event loop
+        with self._lock:
+            c = dict(self.counters)
+            entries = sum(b.size for b in self._buckets.values())
+        audits = c["audits"]
+        return {
+            **c,
+            "entries": entries,
+            "max_size_per_index": self.max_size,
+            "radius": self.radius,
+            "audit_rate": self.audit_rate,
+            "min_index_rows": self.min_index_rows,
+            "hit_rate": round(c["hits"] / c["lookups"], 4) if c["lookups"] else 0.0,
+            "audit_agreement": round(1 - c["audit_mismatches"] / audits, 4) if audits else None,
+        }
@@ -143,6 +143,10 @@ def test_stats_endpoint():
             print_info(f"Unique diseases: {data.get('unique_diseases')}")
             print_info(f"Embedding dimensions: {data.get('embedding_dimensions')}")
             print_info(f"Model: {data.get('model_name')}")
+            registry = data.get('registry') or {}
+            resident = [m.get('name') for m in registry.get('resident_models', [])]
+            print_info(f"Resident models: {', '.join(resident) or 'none'} "
+                       f"({registry.get('memory_used_mb')}/{registry.get('memory_budget_mb')} MB)")
             return True
         else:
             print_error(f"Stats request failed with status: {response.status_code}")
@@ -151,6 +155,90 @@ def test_stats_endpoint():
         print_error(f"Stats error: {e}")
         return False
 
+def test_websocket_endpoint():
+    """Test persistent WebSocket chat channel with pipelined messages"""
+    print_header("Test 6: WebSocket Chat")
+    try:
+        from websockets.sync.client import connect
+    except ImportError:
+        print_error("websockets is not installed. Install with: pip install websockets")
+        return False
+    
+    messages = ["I have fever and headache", "body pain and cough", ""]
+    ws_url = BACKEND_URL.replace("http", "ws", 1) + "/ws/chat"
+    
+    try:
+        with connect(ws_url, open_timeout=5) as ws:
+            # Send everything before reading any reply (pipelining)
+            for i, message in enumerate(messages):
+                ws.send(json.dumps({"id": str(i), "message": message}))
+            
+            replies = {}
+            for _ in messages:
+                data = json.loads(ws.recv(timeout=10))
+                replies[data.get("id")] = data
+        
+        all_passed = True
+        for i, message in enumerate(messages):
+            data = replies.get(str(i))
+            if data is None or "reply" not in data:
+                print_error(f"No reply for message {i}: {data}")
+                all_passed = False
+            else:
+                print_success(f"Reply {i} (confidence: {data.get('confidence', 0):.2%})")
+                print_info(f"Reply preview: {data['reply'][:80]}...")
+        return all_passed
+    except Exception as e:
+        print_error(f"WebSocket error: {e}")
+        return False
+
+def get_cache_stats():
+    response = requests.get(f"{BACKEND_URL}/stats", timeout=5)
+    response.raise_for_status()
+    return response.json().get("semantic_cache") or {}
+
+def test_semantic_cache():
+    """Test that repeated queries are answered from the semantic cache
+    
+    The cache is skipped for small indexes by default; start the server with
+    SEHAT_CACHE_MIN_INDEX_ROWS=0 SEHAT_CACHE_AUDIT_RATE=1 to exercise it.
+    """
+    print_header("Test 7: Semantic Cache")
+    try:
+        before = get_cache_stats()
+        if not before or before.get("max_size_per_index", 0) == 0:
+            print_info("Semantic cache disabled - skipping")
+            return True
+        
+        query = {"message": "I have a high fever and a bad headache"}
+        for _ in range(3):
+            response = requests.post(f"{BACKEND_URL}/chat", json=query, timeout=10)
+            if response.status_code != 200:
+                print_error(f"Request failed with status: {response.status_code}")
+                return False
+        after = get_cache_stats()
+        
+        if after["bypassed"] > before["bypassed"]:
+            print_info(f"Index is smaller than min_index_rows ({after['min_index_rows']}) - cache bypassed")
+            print_info("Start the server with SEHAT_CACHE_MIN_INDEX_ROWS=0 SEHAT_CACHE_AUDIT_RATE=1 to test it")
+            return True
+        
+        hits = after["hits"] - before["hits"]
+        audits = after["audits"] - before["audits"]
+        print_info(f"Hits: {hits}, audits: {audits}, hit rate: {after['hit_rate']:.2%}, "
+                   f"audit agreement: {after['audit_agreement']}")
+        if hits < 2:
+            print_error(f"Expected the repeated query to hit the cache twice, got {hits} hits")
+            return False
+        if after.get("audit_rate") == 1 and (audits < 2 or after["audit_agreement"] != 1.0):
+            print_error("Audited hits should agree with the full scan")
+            return False
+        print_success("Repeated queries served from the semantic cache!")
+        return True
+    except Exception as e:
+        print_error(f"Semantic cache error: {e}")
+        return False
+
 def test_edge_cases():
     """Test edge cases and error handling"""
     print_header("Test 5: Edge Cases")
@@ -209,6 +297,8 @@ def main():
     results.append(("Chat Endpoint", test_chat_endpoint()))
     results.append(("Statistics", test_stats_endpoint()))
     results.append(("Edge Cases", test_edge_cases()))
+    results.append(("WebSocket Chat", test_websocket_endpoint()))
+    results.append(("Semantic Cache", test_semantic_cache()))
     
     # Summary
     print_header("Test Summary")
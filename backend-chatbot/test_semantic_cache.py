@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Behaviour checks for semantic_cache.py (no server or model needed)
+
+Usage:
+    python test_semantic_cache.py
+    # or: python -m pytest test_semantic_cache.py
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from semantic_cache import SemanticCache, CachedResult
+
+KEY = ("mini", "symptom2disease")
+DIM = 8
+
+
+def unit(*values):
+    v = np.zeros(DIM, dtype=np.float32)
+    v[:len(values)] = values
+    return (v / np.linalg.norm(v))[None, :]
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("max_size", 4)
+    kwargs.setdefault("radius", 0.97)
+    kwargs.setdefault("min_index_rows", 0)
+    return SemanticCache(**kwargs)
+
+
+def test_hit_within_radius():
+    cache = make_cache()
+    cache.insert(KEY, unit(1, 0), "v1", CachedResult("Flu", 0.9, "reply"))
+    hit = cache.lookup(KEY, unit(1, 0.05), "v1")
+    assert hit is not None and hit.label == "Flu"
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_outside_radius_and_other_key():
+    cache = make_cache()
+    cache.insert(KEY, unit(1, 0), "v1", CachedResult("Flu", 0.9, "reply"))
+    assert cache.lookup(KEY, unit(1, 1), "v1") is None
+    assert cache.lookup(("multilingual", "symptom2disease"), unit(1, 0), "v1") is None
+    stats = cache.stats()
+    assert stats["misses"] == 2 and stats["hits"] == 0 and stats["hit_rate"] == 0.0
+
+
+def test_new_index_version_invalidates_bucket():
+    cache = make_cache()
+    cache.insert(KEY, unit(1, 0), "v1", CachedResult("Flu", 0.9, "reply"))
+    assert cache.lookup(KEY, unit(1, 0), "v2") is None
+
+    cache.insert(KEY, unit(0, 1), "v2", CachedResult("Malaria", 0.8, "reply"))
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup(KEY, unit(1, 0), "v2") is None
+    assert cache.lookup(KEY, unit(0, 1), "v2").label == "Malaria"
+
+
+def test_lru_eviction():
+    cache = make_cache(max_size=2)
+    cache.insert(KEY, unit(1, 0, 0), "v1", CachedResult("A", 0.9, "a"))
+    cache.insert(KEY, unit(0, 1, 0), "v1", CachedResult("B", 0.9, "b"))
+    # Using A makes B the least recently used entry
+    assert cache.lookup(KEY, unit(1, 0, 0), "v1").label == "A"
+    cache.insert(KEY, unit(0, 0, 1), "v1", CachedResult("C", 0.9, "c"))
+
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup(KEY, unit(0, 1, 0), "v1") is None
+    assert cache.lookup(KEY, unit(1, 0, 0), "v1").label == "A"
+    assert cache.lookup(KEY, unit(0, 0, 1), "v1").label == "C"
+
+
+def test_small_index_bypass():
+    cache = make_cache(min_index_rows=100)
+    assert not cache.applies_to(99)
+    assert cache.applies_to(100)
+    assert cache.stats()["bypassed"] == 1
+    assert not make_cache(max_size=0).applies_to(10 ** 6)
+
+
+def test_audit_agreement():
+    cache = make_cache()
+    cached = CachedResult("Flu", 0.9, "reply")
+    cache.record_audit(cached, "Flu")
+    cache.record_audit(cached, "Malaria")
+    stats = cache.stats()
+    assert stats["audits"] == 2 and stats["audit_mismatches"] == 1
+    assert stats["audit_agreement"] == 0.5
+
+
+def test_save_and_load_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache", "semantic_cache.npz")
+        cache = make_cache(path=path)
+        cache.insert(KEY, unit(1, 0), "v1", CachedResult("Flu", 0.9, "flu reply"))
+        cache.insert(KEY, unit(0, 1), "v1", CachedResult("Malaria", 0.8, "malaria reply"))
+        cache.save()
+        # Only the final file is left behind
+        assert os.listdir(os.path.dirname(path)) == ["semantic_cache.npz"]
+
+        restored = make_cache(path=path)
+        assert restored.load() == 2
+        hit = restored.lookup(KEY, unit(0, 1), "v1")
+        assert hit == CachedResult("Malaria", 0.8, "malaria reply")
+        assert restored.lookup(KEY, unit(0, 1), "v2") is None
+
+
+def test_load_ignores_corrupt_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "semantic_cache.npz")
+        with open(path, "wb") as f:
+            f.write(b"not a zip file")
+        assert make_cache(path=path).load() == 0
+
+
+def main():
+    tests = [(name, fn) for name, fn in globals().items() if name.startswith("test_") and callable(fn)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {e!r}")
+    print(f"\nTotal: {len(tests) - failed}/{len(tests)} tests passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+threading_config.py
+
+CPU threading configuration for encoder inference in the SehatConnect chatbot.
+
+Torch intra/inter-op threads, BLAS threads (used by the `emb_matrix @ q_emb.T`
+product) and the executor that chat requests are encoded on all compete for
+the same cores. This module gives them one configuration surface, applies it
+at startup, and can auto-tune it on the current machine.
+
+Configuration is read from `threading_config.json` next to this file (written
+by --autotune, path overridable with SEHAT_THREADING_CONFIG; it is tuned for
+one machine, so it is git-ignored rather than committed) and then from
+environment variables, which take precedence:
+    SEHAT_TORCH_THREADS          torch intra-op threads
+    SEHAT_TORCH_INTEROP_THREADS  torch inter-op threads
+    SEHAT_BLAS_THREADS           BLAS threads for the similarity product
+    SEHAT_EXECUTOR_WORKERS       worker threads used for /chat inference
+    SEHAT_UVICORN_WORKERS        uvicorn worker processes (default: 1)
+
+Each uvicorn worker is a separate process with its own model copy, torch/BLAS
+pools and executor, so the cores available to one worker's threads are
+cpu_count / uvicorn_workers. Auto-tuning keeps the configured worker count
+and tunes the threads within that share.
+
+Usage:
+    # Benchmark thread combinations and write the best settings
+    python threading_config.py --autotune --objective latency     # one query at a time
+    python threading_config.py --autotune --objective throughput  # concurrent /chat requests
+    python threading_config.py --autotune --objective batched     # model.encode() on query batches
+
+    # Show the effective configuration
+    python threading_config.py
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import List, Optional
+
+import numpy as np
+
+CONFIG_PATH = os.environ.get(
+    "SEHAT_THREADING_CONFIG", os.path.join(os.path.dirname(__file__), "threading_config.json")
+)
+ENV_VARS = {
+    "torch_threads": "SEHAT_TORCH_THREADS",
+    "torch_interop_threads": "SEHAT_TORCH_INTEROP_THREADS",
+    "blas_threads": "SEHAT_BLAS_THREADS",
+    "executor_workers": "SEHAT_EXECUTOR_WORKERS",
+    "uvicorn_workers": "SEHAT_UVICORN_WORKERS",
+}
+OBJECTIVES = ("latency", "throughput", "batched")
+WARMUP_QUERY = "I have fever and headache"
+
+# Keeps the threadpoolctl limit alive for the lifetime of the process
+_blas_limiter = None
+
+
+@dataclass
+class ThreadingConfig:
+    """Thread counts for inference. None means "leave the library default"."""
+    torch_threads: Optional[int] = None
+    torch_interop_threads: Optional[int] = None
+    blas_threads: Optional[int] = None
+    executor_workers: Optional[int] = None
+    uvicorn_workers: Optional[int] = None
+
+
+def load_threading_config(path: str = CONFIG_PATH) -> ThreadingConfig:
+    """Load config from the JSON file (if any), then apply environment overrides."""
+    values = {}
+    if os.path.isfile(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            values.update({k: data[k] for k in ENV_VARS if data.get(k) is not None})
+        except Exception as e:
+            print(f"⚠️ Could not read threading config {path}: {e}")
+
+    for key, env in ENV_VARS.items():
+        raw = os.environ.get(env)
+        if raw:
+            try:
+                values[key] = int(raw)
+            except ValueError:
+                print(f"⚠️ Ignoring invalid {env}={raw!r}")
+
+    # Zero/negative counts mean "library default"
+    values = {k: v for k, v in values.items() if isinstance(v, int) and v > 0}
+    return ThreadingConfig(**values)
+
+
+def save_threading_config(config: ThreadingConfig, path: str = CONFIG_PATH, extra: Optional[dict] = None) -> None:
+    data = asdict(config)
+    if extra:
+        data.update(extra)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def apply_blas_threads(blas_threads: Optional[int]) -> None:
+    global _blas_limiter
+    if not blas_threads:
+        return
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        print("⚠️ threadpoolctl not installed - BLAS thread count left unchanged")
+        return
+    if _blas_limiter is not None:
+        _blas_limiter.restore_original_limits()
+    _blas_limiter = threadpool_limits(limits=blas_threads, user_api="blas")
+
+
+def apply_threading_config(config: ThreadingConfig) -> None:
+    """Apply thread counts to torch and BLAS. Call before the model is loaded."""
+    import torch
+
+    if config.torch_threads:
+        torch.set_num_threads(config.torch_threads)
+    if config.torch_interop_threads:
+        try:
+            torch.set_num_interop_threads(config.torch_interop_threads)
+        except RuntimeError:
+            # Only allowed once, before any inter-op parallel work has started
+            print("⚠️ torch inter-op threads already initialised - keeping current value")
+    apply_blas_threads(config.blas_threads)
+
+    print(
+        f"🧵 Threads: torch={torch.get_num_threads()} interop={torch.get_num_interop_threads()} "
+        f"blas={config.blas_threads or 'default'} executor={config.executor_workers or 'default'} "
+        f"uvicorn_workers={config.uvicorn_workers or 1}"
+    )
+
+
+def executor_size(config: ThreadingConfig) -> int:
+    """Worker count of the inference executor (ThreadPoolExecutor's default if unset)."""
+    return config.executor_workers or min(32, (os.cpu_count() or 1) + 4)
+
+
+def create_executor(config: ThreadingConfig) -> ThreadPoolExecutor:
+    """Executor used to run encodes off the event loop."""
+    return ThreadPoolExecutor(max_workers=executor_size(config), thread_name_prefix="sehat-infer")
+
+
+def _warm_up_thread(model, emb_matrix: np.ndarray, rounds: int) -> float:
+    from medical_chatbot import most_similar
+
+    elapsed = 0.0
+    for _ in range(max(rounds, 1)):
+        start = time.perf_counter()
+        most_similar(WARMUP_QUERY, model, emb_matrix)
+        elapsed = (time.perf_counter() - start) * 1000
+    return elapsed
+
+
+def warm_up(
+    model,
+    emb_matrix: np.ndarray,
+    executor: Optional[ThreadPoolExecutor] = None,
+    workers: int = 1,
+    rounds: int = 2,
+) -> float:
+    """Run a few throwaway encodes so the first real user doesn't pay one-time costs.
+
+    Torch/OpenMP set up their thread pools per calling thread, so with an executor
+    every one of its `workers` threads runs its own warm-up. Returns the slowest
+    last-round duration in milliseconds.
+    """
+    if executor is None:
+        return _warm_up_thread(model, emb_matrix, rounds)
+
+    # The barrier holds each task until all workers are busy, which forces the
+    # executor to start (and so warm up) every one of its threads.
+    barrier = threading.Barrier(workers)
+
+    def task() -> float:
+        try:
+            barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            pass
+        return _warm_up_thread(model, emb_matrix, rounds)
+
+    futures = [executor.submit(task) for _ in range(workers)]
+    return max(f.result() for f in futures)
+
+
+# -----------------------------------------------------------
+# ⏱️ Auto-tuning
+# -----------------------------------------------------------
+def _candidate_counts(max_threads: int) -> List[int]:
+    counts = {1, max_threads}
+    n = 2
+    while n < max_threads:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def _bench_latency(model, emb_matrix: np.ndarray, queries: List[str], repeats: int) -> float:
+    from medical_chatbot import most_similar
+
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        most_similar(queries[i % len(queries)], model, emb_matrix)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _bench_throughput(model, emb_matrix: np.ndarray, queries: List[str], workers: int) -> float:
+    from medical_chatbot import most_similar
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda q: most_similar(q, model, emb_matrix), queries))
+        elapsed = time.perf_counter() - start
+    return len(queries) / elapsed if elapsed > 0 else 0.0
+
+
+def _bench_batched(model, emb_matrix: np.ndarray, queries: List[str], batch_size: int) -> float:
+    """Queries/second when queries are encoded and scored a batch at a time."""
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        q_emb = model.encode(queries[i:i + batch_size], batch_size=batch_size, convert_to_numpy=True)
+        q_emb = q_emb / (np.linalg.norm(q_emb, axis=1, keepdims=True) + 1e-12)
+        np.argmax(emb_matrix @ q_emb.T, axis=0)
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed if elapsed > 0 else 0.0
+
+
+def autotune(
+    model,
+    emb_matrix: np.ndarray,
+    queries: List[str],
+    repeats: int = 30,
+    batch_size: int = 32,
+    uvicorn_workers: int = 1,
+) -> List[dict]:
+    """Benchmark thread combinations for single-query latency, concurrent
+    single-query throughput (how /chat runs) and batched-encode throughput.
+
+    Inter-op threads can only be set once per process, so they are not varied.
+    """
+    import torch
+
+    # Cores one uvicorn worker process gets to itself
+    cores = max((os.cpu_count() or 1) // max(uvicorn_workers, 1), 1)
+    results = []
+    warm_up(model, emb_matrix)
+
+    for torch_threads in _candidate_counts(cores):
+        for blas_threads in sorted({1, torch_threads}):
+            torch.set_num_threads(torch_threads)
+            apply_blas_threads(blas_threads)
+            latency_ms = _bench_latency(model, emb_matrix, queries, repeats)
+            batched_qps = _bench_batched(model, emb_matrix, queries, batch_size)
+
+            # Executor sizes that don't oversubscribe the machine
+            for workers in _candidate_counts(max(cores // torch_threads, 1)):
+                qps = _bench_throughput(model, emb_matrix, queries, workers)
+                results.append({
+                    "torch_threads": torch_threads,
+                    "blas_threads": blas_threads,
+                    "executor_workers": workers,
+                    "p50_latency_ms": round(latency_ms, 2),
+                    "throughput_qps": round(qps, 1),
+                    "batched_qps": round(batched_qps, 1),
+                })
+                print(
+                    f"  torch={torch_threads:<3} blas={blas_threads:<3} workers={workers:<3} "
+                    f"p50={latency_ms:7.2f} ms  concurrent={qps:7.1f} q/s  batched={batched_qps:7.1f} q/s"
+                )
+    return results
+
+
+def pick_best(results: List[dict], objective: str) -> ThreadingConfig:
+    if objective == "throughput":
+        best = max(results, key=lambda r: (r["throughput_qps"], -r["p50_latency_ms"]))
+    elif objective == "batched":
+        best = max(results, key=lambda r: (r["batched_qps"], r["throughput_qps"]))
+    else:
+        best = min(results, key=lambda r: (r["p50_latency_ms"], -r["throughput_qps"]))
+    allowed = {f.name for f in fields(ThreadingConfig)}
+    return ThreadingConfig(**{k: v for k, v in best.items() if k in allowed})
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Threading configuration for the Sehat chatbot encoder")
+    p.add_argument("--autotune", action="store_true", help="Benchmark thread combinations on this machine")
+    p.add_argument("--objective", choices=OBJECTIVES, default="latency",
+                   help="What the written config should optimise for")
+    p.add_argument("--batch-size", type=int, default=32, help="Batch size for the batched-encode benchmark")
+    p.add_argument("--model", default=None, help="Registry model alias to benchmark (default: registry default)")
+    p.add_argument("--queries", type=int, default=64, help="Number of dataset rows used as benchmark queries")
+    p.add_argument("--repeats", type=int, default=30, help="Single-query latency samples per combination")
+    p.add_argument("--output", default=CONFIG_PATH, help="Where to write the tuned config")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    config = load_threading_config()
+
+    if not args.autotune:
+        print(json.dumps(asdict(config), indent=2))
+        return
+
+    from model_registry import ModelRegistry
+
+    # Inter-op threads must be fixed before the model does any work
+    apply_threading_config(ThreadingConfig(torch_interop_threads=config.torch_interop_threads))
+    entry = ModelRegistry.from_env().get(args.model)
+    queries = entry.df["text"].astype(str).head(args.queries).tolist()
+
+    uvicorn_workers = config.uvicorn_workers or 1
+    print(f"⏱️ Auto-tuning on {os.cpu_count()} cores ({uvicorn_workers} uvicorn worker(s)) "
+          f"with {len(queries)} queries ({entry.model_name})...")
+    results = autotune(
+        entry.model, entry.emb_matrix, queries,
+        repeats=args.repeats, batch_size=args.batch_size, uvicorn_workers=uvicorn_workers,
+    )
+    best = pick_best(results, args.objective)
+    best.torch_interop_threads = config.torch_interop_threads
+    best.uvicorn_workers = config.uvicorn_workers
+
+    save_threading_config(best, args.output, extra={"objective": args.objective, "model": entry.model_name})
+    print(f"✅ Best for {args.objective}: {asdict(best)}")
+    print(f"💾 Written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -40,15 +40,42 @@ const getBackendURL = () => {
 };
 
 const BACKEND_URL = getBackendURL();
+// Persistent chat channel - avoids connection setup + CORS preflight per message
+const WS_CHAT_URL = `${BACKEND_URL.replace(/^http/, 'ws')}/ws/chat`;
 
 const CHAT_HISTORY_KEY = '@sehat_chat_history';
 const REQUEST_TIMEOUT = 15000; // 15 seconds for better reliability
+const WS_CONNECT_TIMEOUT = 5000; // Fall back to HTTP if the socket can't open quickly
+const WS_RETRY_BACKOFF = 60000; // After a transport failure, use HTTP only for 1 minute
+
+interface PendingRequest {
+  socket: WebSocket;
+  resolve: (response: ChatbotResponse) => void;
+  reject: (error: Error) => void;
+  timeoutId: ReturnType<typeof setTimeout>;
+}
+
+// The server answered over the socket, but with an error - retrying over HTTP won't help
+class ChatbotServerError extends Error {
+  statusCode: number;
+
+  constructor(statusCode: number, message: string) {
+    super(message);
+    this.name = 'ChatbotServerError';
+    this.statusCode = statusCode;
+  }
+}
 
 class ChatbotService {
   private static instance: ChatbotService;
   private isBackendOnline: boolean = false;
   private lastHealthCheck: number = 0;
   private healthCheckInterval: number = 30000; // 30 seconds
+  private socket: WebSocket | null = null;
+  private socketReady: Promise<WebSocket> | null = null;
+  private pendingRequests: Map<string, PendingRequest> = new Map();
+  private nextRequestId: number = 0;
+  private wsUnavailableUntil: number = 0;
 
   private constructor() {
     // Initial health check - DISABLED to prevent console errors
@@ -64,9 +91,131 @@ class ChatbotService {
   }
 
   /**
-   * Send a message to the chatbot backend with optimized error handling
+   * Open (or reuse) the session's WebSocket chat channel
+   */
+  private connectSocket(): Promise<WebSocket> {
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+      return Promise.resolve(this.socket);
+    }
+    if (this.socketReady) {
+      return this.socketReady;
+    }
+
+    const ws = new WebSocket(WS_CHAT_URL);
+    this.socket = ws;
+    this.socketReady = new Promise<WebSocket>((resolve, reject) => {
+      const connectTimeout = setTimeout(() => {
+        ws.close();
+        reject(new Error('WebSocket connect timeout'));
+      }, WS_CONNECT_TIMEOUT);
+
+      ws.onopen = () => {
+        clearTimeout(connectTimeout);
+        resolve(ws);
+      };
+
+      ws.onmessage = (event: WebSocketMessageEvent) => {
+        let data: any;
+        try {
+          data = JSON.parse(event.data);
+        } catch {
+          return;
+        }
+        const pending = this.pendingRequests.get(String(data.id));
+        if (!pending) {
+          return;
+        }
+        this.pendingRequests.delete(String(data.id));
+        clearTimeout(pending.timeoutId);
+        if (data.error) {
+          pending.reject(new ChatbotServerError(data.status_code, JSON.stringify(data.error)));
+        } else {
+          pending.resolve({
+            reply: data.reply || 'Sorry, I could not process your request.',
+            confidence: data.confidence,
+          });
+        }
+      };
+
+      const onClosed = () => {
+        clearTimeout(connectTimeout);
+        reject(new Error('WebSocket closed'));
+        // Fail this socket's in-flight requests so callers can retry over HTTP
+        this.pendingRequests.forEach((pending, id) => {
+          if (pending.socket === ws) {
+            clearTimeout(pending.timeoutId);
+            pending.reject(new Error('WebSocket closed'));
+            this.pendingRequests.delete(id);
+          }
+        });
+        // A late close from an older socket must not reset the current one
+        if (this.socket !== ws) {
+          return;
+        }
+        this.socket = null;
+        this.socketReady = null;
+      };
+      ws.onerror = onClosed;
+      ws.onclose = onClosed;
+    });
+
+    return this.socketReady;
+  }
+
+  /**
+   * Send a message over the WebSocket channel (several may be in flight at once)
+   */
+  private async sendOverSocket(message: string): Promise<ChatbotResponse> {
+    const ws = await this.connectSocket();
+    const id = String(++this.nextRequestId);
+
+    return new Promise<ChatbotResponse>((resolve, reject) => {
+      const timeoutId = setTimeout(() => {
+        this.pendingRequests.delete(id);
+        const timeoutError = new Error('⏱️ Request timeout - Server is slow. Please try again.');
+        timeoutError.name = 'TimeoutError';
+        reject(timeoutError);
+      }, REQUEST_TIMEOUT);
+
+      this.pendingRequests.set(id, { socket: ws, resolve, reject, timeoutId });
+      ws.send(JSON.stringify({ id, message }));
+    });
+  }
+
+  /**
+   * Send a message to the chatbot - WebSocket first, HTTP as fallback
    */
   public async sendMessage(message: string): Promise<ChatbotResponse> {
+    if (Date.now() < this.wsUnavailableUntil) {
+      return this.sendMessageHttp(message);
+    }
+
+    try {
+      const response = await this.sendOverSocket(message);
+      this.isBackendOnline = true;
+      return response;
+    } catch (error: any) {
+      if (error.name === 'ChatbotServerError') {
+        // Same inference path as /chat - the HTTP endpoint would fail the same way
+        throw this.toUserError(error);
+      }
+      if (error.name === 'TimeoutError') {
+        // The server may still be answering; don't send the same message again
+        this.isBackendOnline = false;
+        throw error;
+      }
+
+      // Transport failure (blocked upgrade, proxy, dropped link): stop trying the socket for a while
+      console.log('⚠️ WebSocket chat failed, falling back to HTTP:', error.message);
+      this.wsUnavailableUntil = Date.now() + WS_RETRY_BACKOFF;
+      return this.sendMessageHttp(message);
+    }
+  }
+
+  /**
+   * Send a message to the chatbot backend with optimized error handling
+   */
+  private async sendMessageHttp(message: string): Promise<ChatbotResponse> {
     const requestUrl = `${BACKEND_URL}/chat`;
     console.log('='.repeat(60));
     console.log('🤖 ChatbotService - SENDING MESSAGE');
@@ -110,8 +259,7 @@ class ChatbotService {
 
       if (!response.ok) {
         const errorText = await response.text();
-        console.error('🤖 ChatbotService - Error response:', errorText);
-        throw new Error(`HTTP ${response.status}: ${errorText || 'Server error'}`);
+        throw new ChatbotServerError(response.status, errorText || 'Server error');
       }
 
       const data = await response.json();
@@ -134,6 +282,10 @@ class ChatbotService {
       console.error('❌ Error stack:', error.stack);
       console.log('='.repeat(60));
       
+      if (error.name === 'ChatbotServerError') {
+        throw this.toUserError(error);
+      }
+      
       this.isBackendOnline = false;
       
       if (error.name === 'AbortError') {
@@ -145,6 +297,24 @@ class ChatbotService {
     }
   }
 
+  /**
+   * Turn an error response from the server (WebSocket or HTTP) into the error shown to the user
+   */
+  private toUserError(error: ChatbotServerError): Error {
+    console.error('🤖 ChatbotService - Error response:', error.statusCode, error.message);
+
+    // The server answered; 5xx means it can't serve chats right now (e.g. model not loaded)
+    this.isBackendOnline = error.statusCode < 500;
+
+    if (error.statusCode === 503) {
+      return new Error('⏳ Sehat AI is not ready yet. Please try again in a moment.');
+    }
+    if (error.statusCode >= 400 && error.statusCode < 500) {
+      return new Error('⚠️ Sehat AI could not process that message. Please rephrase and try again.');
+    }
+    return new Error('🔌 Unable to connect to Sehat AI. Server may be offline. Please retry.');
+  }
+
   /**
    * Save chat history to AsyncStorage
    */